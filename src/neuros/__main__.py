@@ -30,7 +30,7 @@ def main() -> None:
 
     channels = board.get_eeg_channels(board.board_id)
     print('shape', board.rdata.shape)
-    print(board.rdata[:, channels].shape)
+    print(board.rdata[channels].shape)
     print('chans', board.get_board_descr(board.board_id)['eeg_channels'])
 
     # Fill the data buffer
@@ -1,21 +1,47 @@
 import logging
 import numpy as np
-import pandas as pd
 import threading
-import time
 
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
-from brainflow import DataFilter, DetrendOperations, FilterTypes, WindowOperations
 from contextlib import contextmanager
 from dataclasses import dataclass, field
 from datetime import timedelta
 from enum import Enum
-from typing import Iterator, Optional, Tuple, List
+from typing import Dict, Iterator, Optional, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _blackman_harris(size: int) -> np.ndarray:
+    '''Periodic 4-term window, identical to WindowOperations.BLACKMAN_HARRIS in BrainFlow'''
+    x = 2 * np.pi * np.arange(size) / size
+    return 0.355768 - 0.487396*np.cos(x) + 0.144232*np.cos(2*x) - 0.012604*np.cos(3*x)
+
+
+def _fast_len(size: int) -> int:
+    '''Largest even length <= size with no prime factors above 5, the fast case for the FFT'''
+    best = 2
+    p2 = 2
+    while p2 <= size:
+        p3 = p2
+        while p3 <= size:
+            p5 = p3
+            while p5 <= size:
+                best = max(best, p5)
+                p5 *= 5
+            p3 *= 3
+        p2 *= 2
+    return best
+
+
+# precision of the psd pipeline; raw data stays float64 as it carries unix timestamps
+PSD_DTYPE = np.float32
+
+
 @dataclass(frozen=True)
 class BoardReaderParams:
     """
@@ -43,27 +69,100 @@ class BoardReader(BoardShim):
     def __init__(self, params: BoardReaderParams):
         super().__init__(params.board_id, params.brainflow_params)
         self.params = params
+
+        # board constants, looked up from BrainFlow once per reader
+        self._sampling_rate = BoardShim.get_sampling_rate(self.board_id)
+        self._num_channels = BoardShim.get_num_rows(self.board_id)
+        self._num_samples = int(self._sampling_rate * params.window.total_seconds()) + 1
+        self._eeg_channels = np.asarray(BoardShim.get_eeg_channels(self.board_id), dtype=np.intp)
+        self._eeg_names = tuple(BoardShim.get_eeg_names(self.board_id))
+
         self.stop_event = threading.Event() # external signal to stop reading data from board
-        self._update = threading.Event() # internal signal new data has been read
-        self.rdata = self._make_data() # raw data from the board
-        self.pdata = self._make_data() # processed data (psd)
+        self.filled_event = threading.Event() # set once a full window of data has been read
+        self._num_read = 0 # samples read since the reader started, until the window is full
+        self._cv = threading.Condition() # guards the raw data ring buffer, notified on every update
+        self._rev = 0 # count of updates published, identifies the data in use
+        self._buf = self._make_data() # raw data from the board, circular
+        self._head = 0 # column of the oldest sample in _buf (next one to overwrite)
+
+        # processed data, band power of each eeg channel
+        # replaced (never modified) by the reader thread, so readers need no lock
+        num_eeg = len(self._eeg_names)
+        self._power = np.zeros((len(Bands), num_eeg), dtype=PSD_DTYPE) # rows follow Bands
+        self._power.flags.writeable = False
+        self._eeg_cols = {n: i for i, n in enumerate(self._eeg_names)}
+
+        # power spectral density setup, reproduces DataFilter.get_psd + get_band_power
+        self._psd_size = _fast_len(self._num_samples) # most recent samples used for the psd
+        self._window = _blackman_harris(self._psd_size).astype(PSD_DTYPE)
+        self._band_lo, self._band_hi = self._make_band_bins().T
+        self._band_edges = np.stack((self._band_lo, self._band_hi + 1), axis=1).ravel() # reduceat segments
+        self._windowed = np.empty((num_eeg, self._psd_size), dtype=PSD_DTYPE) # fft input, reused across calls
+        self._psd = np.zeros((num_eeg, self._psd_size//2 + 2), dtype=PSD_DTYPE) # last column stays zero
 
     def get_num_channels(self) -> int:
-        return BoardShim.get_num_rows(self.board_id)
+        return self._num_channels
 
     def get_sampling_rate(self) -> float:
         '''sampling rate in samples per second'''
-        return BoardShim.get_sampling_rate(self.board_id)
+        return self._sampling_rate
 
     def get_num_samples(self) -> int:
-        samples_per_sec = self.get_sampling_rate()
-        return int(samples_per_sec * self.params.window.total_seconds()) + 1
+        return self._num_samples
 
     def _make_data(self) -> np.ndarray:
-        '''2D array shape=(num_samples, num_channels)'''
-        num_channels = self.get_num_channels()
-        num_samples = self.get_num_samples()
-        return np.zeros(shape=(num_samples, num_channels))
+        '''2D array shape=(num_channels, num_samples), each channel contiguous as BrainFlow returns it'''
+        return np.zeros(shape=(self._num_channels, self._num_samples))
+
+    def _make_band_bins(self) -> np.ndarray:
+        '''First and last psd bin (inclusive) of each band, chosen as DataFilter.get_band_power does'''
+        freqs = np.fft.rfftfreq(self._psd_size, 1.0 / self._sampling_rate)
+        bins = np.empty((len(Bands), 2), dtype=np.intp) # rows follow Bands
+        for i, b in enumerate(Bands):
+            bins[i, 0] = np.searchsorted(freqs, b.value[0], side='left')
+            bins[i, 1] = min(np.searchsorted(freqs, b.value[1], side='right'), len(freqs)-1)
+        return bins
+
+    @property
+    def rdata(self) -> np.ndarray:
+        '''raw data from the board, oldest sample first'''
+        with self._cv:
+            return np.concatenate((self._buf[:, self._head:], self._buf[:, :self._head]), axis=1)
+
+    def _write_data(self, data: np.ndarray) -> None:
+        '''Overwrite the oldest samples in the ring buffer with data shape=(num_channels, n)'''
+        num_samples = self._num_samples
+        data = data[:, -num_samples:]
+        end = self._head + data.shape[1]
+        with self._cv:
+            if end <= num_samples:
+                self._buf[:, self._head:end] = data
+            else:
+                split = num_samples - self._head
+                self._buf[:, self._head:] = data[:, :split]
+                self._buf[:, :end - num_samples] = data[:, split:]
+            self._head = end % num_samples
+
+    def _update(self, data: np.ndarray) -> None:
+        '''Stores newly read data and publishes the band power computed from it'''
+        self._write_data(data)
+        power = self._compute_power()
+        power.flags.writeable = False # shared with every reader, must not change once published
+        with self._cv:
+            self._power = power
+            self._rev += 1
+            self._cv.notify_all()
+
+        if not self.filled_event.is_set():
+            self._num_read += data.shape[1]
+            if self._num_read >= self._num_samples:
+                self.filled_event.set()
+
+    def wait_for_data(self, rev: int, timeout: Optional[float] = None) -> int:
+        '''Blocks until data newer than revision rev has been read, returns the current revision'''
+        with self._cv:
+            self._cv.wait_for(lambda: self._rev != rev, timeout)
+            return self._rev
 
     def start_reading(self):
         self.thread = threading.Thread(target=self._read_data, args=())
@@ -77,46 +176,71 @@ class BoardReader(BoardShim):
         self.prepare_session()
         self.start_stream()
 
-        num_samples = self.get_num_samples()
+        # wait for a polling interval worth of samples rather than a fixed sleep
+        sample_rate = self.get_sampling_rate()
+        batch = max(1, int(sample_rate * self.params.polling.total_seconds()))
         while not self.stop_event.is_set():
-            time.sleep(self.params.polling.total_seconds())
-            rdata = self.get_board_data()
-            rdata = np.transpose(rdata)
-            self.rdata = np.append(self.rdata, rdata, axis=0)[-num_samples:]
-            self._update.set()
+            available = self.get_board_data_count()
+            if available < batch:
+                self.stop_event.wait((batch - available) / sample_rate)
+                continue
+            self._update(self.get_board_data())
+
+        # keep whatever arrived since the last batch
+        if self.get_board_data_count():
+            self._update(self.get_board_data())
 
         self.stop_stream()
         self.release_session()
 
     def get_eeg_names(self) -> List[str]:
-        return BoardShim.get_eeg_names(self.board_id)
+        return list(self._eeg_names)
 
-    # NOTE: possible optimization to transpose the data?
-    # CAUTION: this method takes about 20ms to execute
-    def get_eeg_power(self) -> pd.DataFrame:
+    def get_eeg_power(self) -> 'BandPower':
         '''Returns brainwave band power of the EEG channels'''
-        if not self._update.is_set():
-            return self.pdata
+        return BandPower(self._power, self._eeg_cols)
 
-        sample_rate = self.get_sampling_rate()
-        channels = self.get_eeg_channels(self.board_id)
-        names = self.get_eeg_names()
+    def get_eeg_power_df(self) -> 'pd.DataFrame':
+        '''Returns brainwave band power of the EEG channels as a pandas DataFrame'''
+        import pandas as pd # optional dependency, only needed for this view
+        return pd.DataFrame(self._power, columns=self.get_eeg_names(), index=[b for b in Bands])
+
+    def get_band_power(self, channel: str, band: 'Bands') -> float:
+        '''Returns the power of a single band on one EEG channel'''
+        return float(self._power[_BAND_ROWS[band], self._eeg_cols[channel]])
 
-        # work on copy of the raw data, trimmed to the eeg channels
-        rdata = self.rdata[:, channels]
-        size = self.get_num_samples()
-        size = size-1 if size%2 else size # truncate to nearest even number
+    def _compute_power(self) -> np.ndarray:
+        '''Band power of the current raw data, shape=(num_bands, num_eeg_channels)
+        Only called from the reader thread, which owns the psd buffers'''
+        sample_rate = self._sampling_rate
 
-        # compute the power spectral density
-        pdata = pd.DataFrame(columns=names, index=[b for b in Bands])
-        for c in range(len(channels)):
-            psd = DataFilter.get_psd(rdata[:, c][:size], sample_rate, WindowOperations.BLACKMAN_HARRIS)
-            for b in Bands:
-                pdata.loc[b, names[c]] = DataFilter.get_band_power(psd, *b.value)
+        # window the most recent samples of the eeg channels straight from the ring buffer,
+        # the reader thread is its only writer so it needs no lock or unrolled copy
+        size = self._psd_size
+        buf, rows, window = self._buf, self._eeg_channels, self._window
+        head = self._head
+        start = (head - size) % self._num_samples
+        if start < head:
+            np.multiply(buf[rows, start:head], window, out=self._windowed)
+        else: # the samples wrap around the end of the ring
+            split = self._num_samples - start
+            np.multiply(buf[rows, start:], window[:split], out=self._windowed[:, :split])
+            np.multiply(buf[rows, :head], window[split:], out=self._windowed[:, split:])
 
-        self.pdata = pdata
-        self._update.clear()
-        return self.pdata
+        # power spectral density of all channels in a single transform
+        psd = self._psd[:, :-1]
+        np.abs(np.fft.rfft(self._windowed, axis=1), out=psd)
+        np.square(psd, out=psd)
+        psd *= 2.0 / (sample_rate * size)
+        psd[:, [0, -1]] /= 2 # dc and nyquist bins have no mirror image
+
+        # band power is the trapezoidal integral of the psd across the band,
+        # all bands summed at once over the [lo, hi+1) segments of the padded psd
+        df = sample_rate / size
+        power = np.add.reduceat(self._psd, self._band_edges, axis=1)[:, ::2]
+        power -= 0.5 * (psd[:, self._band_lo] + psd[:, self._band_hi])
+        power *= df
+        return power.T # a new array each call, earlier results stay valid
 
 
 class Bands(Enum):
@@ -127,3 +251,37 @@ class Bands(Enum):
     GAMMA = (30.0, 50.0) # below 60Hz to avoid ambient electricity
     ALL = (0.5, 50.0)
 
+
+_BAND_ROWS = {b: i for i, b in enumerate(Bands)} # row of each band in a power array
+
+
+class BandPower(object):
+    '''
+    Band power of the EEG channels, indexed as power[channel][band]
+    '''
+
+    def __init__(self, power: np.ndarray, columns: Dict[str, int]):
+        self.power = power # shape=(num_bands, num_channels), rows follow Bands
+        self.columns = columns # eeg channel name -> column
+
+    def __getitem__(self, channel: str) -> 'ChannelPower':
+        return ChannelPower(self.power[:, self.columns[channel]])
+
+    def __repr__(self) -> str:
+        lines = ['\t'.join(['band'] + list(self.columns))]
+        for b in Bands:
+            lines.append('\t'.join([b.name] + ['%.4g' % v for v in self.power[_BAND_ROWS[b]]]))
+        return '\n'.join(lines)
+
+
+class ChannelPower(object):
+    '''
+    Band power of a single EEG channel, indexed as power[band]
+    '''
+
+    def __init__(self, power: np.ndarray):
+        self.power = power # shape=(num_bands,), rows follow Bands
+
+    def __getitem__(self, band: Bands) -> float:
+        return float(self.power[_BAND_ROWS[band]])
+
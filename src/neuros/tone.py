@@ -1,6 +1,5 @@
 import math
 import threading
-import time
 
 from fluidsynth import Synth
 from importlib.resources import files
@@ -47,10 +46,15 @@ class Tone(object):
     def _play_note(self):
         # Play a note in the upper half of the volume range
         vmax = 0.0
+        last_vol = None
+        rev = 0
         while self._playing.is_set():
-            v = self.board.get_eeg_power()[self.channel][self.band]
+            # band power only changes when the board reads new data
+            rev = self.board.wait_for_data(rev, timeout=0.1)
+            v = self.board.get_band_power(self.channel, self.band)
             vmax = max(v, vmax)
-            vol = 64 + 64 * (v / vmax)
-            Tone.synth.cc(self.cid, VOLUME, int(vol))
-            time.sleep(0.005)
+            vol = 64 + int(63 * v / vmax) if vmax > 0.0 else 64 # cc range is 0..127
+            if vol != last_vol: # only message fluidsynth when the volume changes
+                Tone.synth.cc(self.cid, VOLUME, vol)
+                last_vol = vol
 
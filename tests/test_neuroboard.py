@@ -5,6 +5,8 @@ import pytest
 import threading
 import time
 from brainflow import BoardIds
+from brainflow.data_filter import DataFilter, WindowOperations
+from datetime import timedelta
 from neuros.neuroboard import BoardReaderParams, BoardReader, Bands
 
 
@@ -14,11 +16,10 @@ def board():
   return BoardReader(params)
 
 def test_data_initialization(board):
-    assert board.rdata.shape[0] == board.get_num_samples()
-    assert board.rdata.shape[1] == board.get_num_channels()
+    assert board.rdata.shape[0] == board.get_num_channels()
+    assert board.rdata.shape[1] == board.get_num_samples()
 
-    num_data = np.count_nonzero(board.rdata[:,0])
-    assert num_data == 0
+    assert not board.rdata[0,:].any()
 
 
 def test_data_single_iteration_read(board):
@@ -28,36 +29,112 @@ def test_data_single_iteration_read(board):
 
     # board data only partially filled the reading window
     # and appends to the end
-    num_data = np.count_nonzero(board.rdata[:,0])
+    num_data = np.count_nonzero(board.rdata[0,:])
     assert num_data > 0
-    end_data = np.count_nonzero(board.rdata[-num_data:,0])
+    end_data = np.count_nonzero(board.rdata[0,-num_data:])
     assert end_data > 0
 
-    assert board.rdata.shape[0] == board.get_num_samples()
-    assert board.rdata.shape[1] == board.get_num_channels()
+    assert board.rdata.shape[0] == board.get_num_channels()
+    assert board.rdata.shape[1] == board.get_num_samples()
 
 
 def test_data_filling(board):
-    intervals = int(board.params.window / board.params.polling) + 1
     board.start_reading()
-    time.sleep(intervals * board.params.polling.total_seconds())
+    assert board.filled_event.wait(timeout=5)
     board.stop_reading()
 
     # data is completely full, did not change shape
-    num_data = np.count_nonzero(board.rdata[:,1])
-    assert num_data == len(board.rdata[:,1])
-    assert board.rdata.shape[0] == board.get_num_samples()
-    assert board.rdata.shape[1] == board.get_num_channels()
+    assert board.rdata[1,:].all()
+    assert board.rdata.shape[0] == board.get_num_channels()
+    assert board.rdata.shape[1] == board.get_num_samples()
 
 
 def test_power(board):
     # full window of data
-    intervals = int(board.params.window / board.params.polling) + 1
     board.start_reading()
-    time.sleep(intervals * board.params.polling.total_seconds())
+    assert board.filled_event.wait(timeout=5)
     board.stop_reading()
 
-    # second channel of the synthetic board has a 10Hz signal
+    # second channel of the synthetic board has a 10Hz signal,
+    # alpha dominates every other band, its power stays near 100 up to the noise
     channel = board.get_eeg_names()[1]
-    power = board.get_eeg_power()[channel][Bands.ALPHA]
-    assert 100 <= power
+    power = board.get_eeg_power()[channel]
+    for band in (Bands.DELTA, Bands.THETA, Bands.BETA, Bands.GAMMA):
+        assert power[band] < power[Bands.ALPHA]
+    assert power[Bands.ALPHA] == pytest.approx(100, rel=0.15)
+
+
+@pytest.mark.parametrize('seconds', [0.7, 1, 2.3])
+def test_power_matches_data_filter(seconds):
+    # 0.7s is 176 samples, of which the psd uses the most recent 162
+    board = BoardReader(BoardReaderParams(board_id=BoardIds.SYNTHETIC_BOARD, window=timedelta(seconds=seconds)))
+    rng = np.random.default_rng(7)
+    board._write_data(rng.standard_normal((board.get_num_channels(), board.get_num_samples())) * 20)
+    power = board._compute_power()
+
+    size = board._psd_size
+    sample_rate = board.get_sampling_rate()
+    for col, channel in enumerate(board._eeg_channels):
+        psd = DataFilter.get_psd(np.ascontiguousarray(board.rdata[channel, -size:]), sample_rate,
+                                 WindowOperations.BLACKMAN_HARRIS)
+        for row, band in enumerate(Bands):
+            expected = DataFilter.get_band_power(psd, *band.value)
+            assert power[row, col] == pytest.approx(expected, rel=1e-5)
+
+
+def test_power_independent_of_ring_position():
+    # psd window is read straight from the ring buffer, whether or not it wraps at the end
+    board = BoardReader(BoardReaderParams(board_id=BoardIds.SYNTHETIC_BOARD, window=timedelta(seconds=0.7)))
+    num_samples = board.get_num_samples()
+    rng = np.random.default_rng(7)
+    data = rng.standard_normal((board.get_num_channels(), 2*num_samples)) * 20
+    board._write_data(data[:, -num_samples:])
+    expected = board._compute_power()
+
+    for head in range(num_samples):
+        board._write_data(data[:, :head])
+        board._write_data(data[:, -num_samples:])
+        np.testing.assert_array_equal(board._compute_power(), expected)
+        board._head = 0
+
+
+def test_band_power(board):
+    # full window of data
+    board.start_reading()
+    assert board.filled_event.wait(timeout=5)
+    board.stop_reading()
+
+    # single cell lookup agrees with the full table
+    channel = board.get_eeg_names()[1]
+    power = board.get_band_power(channel, Bands.ALPHA)
+    assert 0 < power
+    assert power == pytest.approx(board.get_eeg_power()[channel][Bands.ALPHA])
+
+    # published power is shared between readers and cannot be modified
+    with pytest.raises(ValueError):
+        board.get_eeg_power().power[0, 0] = -1
+
+
+def test_wait_for_data(board):
+    # nothing is read before the board starts
+    assert board.wait_for_data(0, timeout=0.01) == 0
+
+    board.start_reading()
+    rev = board.wait_for_data(0, timeout=5)
+    assert rev > 0
+    assert board.wait_for_data(rev, timeout=5) > rev
+    board.stop_reading()
+
+
+def test_power_dataframe(board):
+    pytest.importorskip('pandas')
+    board.start_reading()
+    assert board.filled_event.wait(timeout=5)
+    board.stop_reading()
+
+    power = board.get_eeg_power()
+    pdata = board.get_eeg_power_df()
+    assert list(pdata.columns) == board.get_eeg_names()
+    assert list(pdata.index) == list(Bands)
+    channel = board.get_eeg_names()[1]
+    assert pdata[channel][Bands.ALPHA] == pytest.approx(power[channel][Bands.ALPHA])